@@ -16,6 +16,59 @@ TIFF_Name = "snowdepth.tiff"       #Edit this to change the name of the tiff fil
 DEFAULT_TIFF_PATH = Path(__file__).parent / "TIFF-Storrage" / TIFF_Name
 TIFF_FILE = os.environ.get("TIFF_FILE_PATH", str(DEFAULT_TIFF_PATH))
 
+# Warp the TIFF file to Web Mercator once at startup and serve tiles from the copy
+# with plain window reads (set PREWARP_TIFF=0 to reproject every tile on the fly)
+PREWARP_TIFF = os.environ.get("PREWARP_TIFF", "1") != "0"
+WARPED_TIFF_FILE = os.environ.get(
+    "WARPED_TIFF_FILE_PATH", str(Path(TIFF_FILE).with_suffix(".3857.tif"))
+)
+
+# GDAL block cache settings, applied through the environment so they are in place
+# before the first dataset is opened. Block reads from the long-lived dataset
+# handles stay in RAM across tile requests.
+# The GDAL_CACHEMAX env var defaults to 512 MB and takes any value GDAL accepts (e.g. "10%").
+os.environ.setdefault("GDAL_CACHEMAX", "512")
+os.environ.setdefault("VSI_CACHE", "TRUE")
+
+# GDAL warper threads and working memory (MB) for the one-time prewarp
+WARP_THREADS = int(os.environ.get("WARP_THREADS", str(max(1, (os.cpu_count() or 1) - 1))))
+WARP_MEM_LIMIT = int(os.environ.get("WARP_MEM_LIMIT", "256"))
+
+# GDAL warper threads for each live tile reprojection. Tiles are already rendered
+# in parallel by TILE_WORKERS threads, so extra warper threads would oversubscribe the CPUs
+TILE_WARP_THREADS = int(os.environ.get("TILE_WARP_THREADS", "1"))
+
+# Production mode: uvloop/httptools and no auto-reload. WEB_WORKERS server processes
+# are started (1 by default); each has its own tile threads, tile cache and GDAL
+# block cache, and only logs to stdout when there are several of them.
+PROD = os.environ.get("PROD", "0") == "1"
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", "1")) if PROD else 1
+
+# Number of threads rendering tiles off the event loop, in each server process.
+# The default is split across server processes so they share the CPUs.
+TILE_WORKERS = int(os.environ.get(
+    "TILE_WORKERS", str(max(2, min(32, (os.cpu_count() or 1) * 2) // WEB_WORKERS))
+))
+
+# Total size (MB) of the rendered PNGs kept in each process's in-memory LRU
+# cache (0 disables it)
+TILE_CACHE_MB = float(os.environ.get("TILE_CACHE_MB", "128"))
+TILE_CACHE_BYTES = int(TILE_CACHE_MB * 1024 * 1024)
+
+# Minimum number of seconds between checks of the TIFF file's modification time
+# (0 or less checks on every tile request)
+TIFF_STAT_INTERVAL = float(os.environ.get("TIFF_STAT_INTERVAL", "30"))
+
+# zlib level used for PNG tiles (0-9). Level 3 encodes about twice as fast as
+# Pillow's default of 6; levels 1-2 are faster still but can produce much larger tiles.
+PNG_COMPRESS_LEVEL = int(os.environ.get("PNG_COMPRESS_LEVEL", "3"))
+
+# Browser/CDN cache lifetime for served tiles
+TILE_MAX_AGE = int(os.environ.get("TILE_MAX_AGE", "86400"))
+
+# Fraction of successful tile requests that get logged (1 logs all, 0 none)
+TILE_LOG_SAMPLE_RATE = float(os.environ.get("TILE_LOG_SAMPLE_RATE", "0.01"))
+
 logger.info(f"Using TIFF file path: {TIFF_FILE}")
 if "TIFF_FILE_PATH" in os.environ:
     logger.debug("TIFF file path set from environment variable")
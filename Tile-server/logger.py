@@ -1,31 +1,57 @@
 """
 Centralized logging configuration for the Tile Server.
 """
+import atexit
+import functools
 import logging
+import queue
 import sys
 import os
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
 from pathlib import Path
 
 # Create logs directory if it doesn't exist
 log_dir = Path(__file__).parent / "logs"
 log_dir.mkdir(exist_ok=True)
 
+# Default log level, parsed once from the environment (unknown names fall back to INFO)
+_LOG_LEVEL = getattr(logging, os.environ.get('LOG_LEVEL', 'INFO').upper(), logging.INFO)
+
+# Several production server processes (config.WEB_WORKERS) would each rotate the
+# same log files and lose records, so they only log to stdout
+_LOG_TO_FILE = not (os.environ.get("PROD", "0") == "1" and int(os.environ.get("WEB_WORKERS", "1")) > 1)
+
+# Background listeners that own the real handlers; stopped (and flushed) at exit
+_listeners = []
+
+@atexit.register
+def _stop_listeners():
+    for listener in _listeners:
+        listener.stop()
+
 # Configure the root logger
+@functools.lru_cache(maxsize=None)
 def setup_logger(name=None, level=None):
     """
-    Set up logger with file and console handlers.
+    Set up logger with file and console handlers (console only when several
+    production server processes run).
+    
+    The handlers run on a background QueueListener thread; the logger itself only
+    gets a QueueHandler, so logging on the request path is a queue put and never
+    waits on console or file I/O (or the midnight rollover).
     
     Args:
         name: Logger name (None for root logger)
-        level: Logging level (None uses environment or defaults to INFO)
+        level: Logging level name or number (None uses environment or defaults to INFO)
     
     Returns:
         Configured logger
     """
     # Determine log level (environment var takes precedence)
     if level is None:
-        level = os.environ.get('LOG_LEVEL', 'INFO').upper()
+        level = _LOG_LEVEL
+    elif isinstance(level, str):
+        level = getattr(logging, level.upper())
     
     # Get the logger
     logger = logging.getLogger(name)
@@ -35,32 +61,38 @@ def setup_logger(name=None, level=None):
         return logger
     
     # Set log level
-    logger.setLevel(getattr(logging, level))
+    logger.setLevel(level)
     
     # Create console handler
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(getattr(logging, level))
+    console_handler.setLevel(level)
     
-    # Create file handler with rotation (new file each day, keep 30 days)
-    log_file = log_dir / f"{name or 'tileserver'}.log"
-    file_handler = TimedRotatingFileHandler(
-        filename=log_file,
-        when="midnight",
-        interval=1,
-        backupCount=30,
-    )
-    file_handler.setLevel(getattr(logging, level))
-    
-    # Create and set formatter for both handlers
+    # Create and set formatter for all handlers
     formatter = logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
     console_handler.setFormatter(formatter)
-    file_handler.setFormatter(formatter)
+    handlers = [console_handler]
+    
+    # Create file handler with rotation (new file each day, keep 30 days)
+    if _LOG_TO_FILE:
+        log_file = log_dir / f"{name or 'tileserver'}.log"
+        file_handler = TimedRotatingFileHandler(
+            filename=log_file,
+            when="midnight",
+            interval=1,
+            backupCount=30,
+        )
+        file_handler.setLevel(level)
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
     
-    # Add handlers to logger
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    # Hand records to a background thread that writes them to the handlers
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    logger.addHandler(QueueHandler(log_queue))
     
     return logger
 
@@ -1,9 +1,12 @@
 """
 Main module for the GeoTIFF Tile Server.
 """
+import asyncio
 import uvicorn
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from fastapi import FastAPI, HTTPException, Response
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import sys
 
@@ -11,17 +14,50 @@ import sys
 sys.path.append(str(Path(__file__).parent.parent))
 
 # Use direct imports instead of package imports
-from config import TIFF_FILE
-from utils import validate_tiff_file
+from config import TIFF_FILE, WARPED_TIFF_FILE, TILE_MAX_AGE, PREWARP_TIFF, TILE_WORKERS, TIFF_STAT_INTERVAL, PROD, WEB_WORKERS
+from utils import validate_tiff_file, tiff_exists, refresh_tiff_stat
 from tile_service import TileService
 from logger import setup_logger
 from middleware import log_requests
+from prewarp import prewarp_tiff, is_prewarped
 
 # Setup logger for this module
 logger = setup_logger('main')
 
 
-app = FastAPI(title="GeoTIFF Tile Server")
+# orjson serializes in C, which keeps the frequently polled /health endpoint cheap
+app = FastAPI(title="GeoTIFF Tile Server", default_response_class=ORJSONResponse)
+
+# Info bodies only depend on whether the TIFF file exists, so build them once
+ROOT_RESPONSES = {
+    exists: {
+        "server": "GeoTIFF Tile Server",
+        "endpoints": {
+            "tiles": "/tiles/{z}/{x}/{y}.png",
+            "health": "/health"
+        },
+        "tiff_file": TIFF_FILE,
+        "tiff_exists": exists
+    }
+    for exists in (True, False)
+}
+HEALTH_RESPONSES = {
+    True: {"status": "healthy", "tiff_file": TIFF_FILE, "tiff_exists": True},
+    False: {"status": "unhealthy", "tiff_file": TIFF_FILE, "tiff_exists": False},
+}
+
+# Thread pool for tile rendering, so GDAL I/O, NumPy work and PNG encoding
+# don't block the event loop (created on startup)
+tile_executor = None
+
+# Background task keeping the cached TIFF file stat fresh
+tiff_stat_task = None
+
+async def refresh_tiff_stat_periodically():
+    """Re-stat the TIFF file in the background so requests never have to."""
+    while True:
+        await asyncio.sleep(TIFF_STAT_INTERVAL)
+        refresh_tiff_stat()
 
 # Add CORS middleware to allow requests from the frontend
 app.add_middleware(
@@ -38,54 +74,88 @@ app.middleware("http")(log_requests)
 @app.on_event("startup")
 async def startup_event():
     """Run startup tasks."""
+    global tile_executor, tiff_stat_task
     logger.info("Starting GeoTIFF Tile Server")
+    tile_executor = ThreadPoolExecutor(max_workers=TILE_WORKERS, thread_name_prefix="tile")
+    refresh_tiff_stat()
+    # With an interval of 0 or less the file is stat-ed on every request instead
+    if TIFF_STAT_INTERVAL > 0:
+        tiff_stat_task = asyncio.create_task(refresh_tiff_stat_periodically())
     
     # Validate TIFF file on startup
     if not validate_tiff_file():
         logger.warning("Starting server without valid TIFF file. Some endpoints may not work correctly.")
     else:
         logger.info(f"TIFF file found at: {TIFF_FILE}")
+        # Serve from a Web Mercator copy when possible, so tiles are window reads.
+        # In production the parent process warps it once before starting the
+        # workers, so each worker only opens the finished copy.
+        if not PREWARP_TIFF:
+            warped_file = None
+        elif PROD:
+            warped_file = WARPED_TIFF_FILE if is_prewarped() else None
+        else:
+            warped_file = prewarp_tiff()
+        
+        # Open the dataset once so tile requests don't pay for it
+        TileService.open_dataset(warped_file or TIFF_FILE)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Run shutdown tasks."""
+    logger.info("Stopping GeoTIFF Tile Server")
+    if tiff_stat_task is not None:
+        tiff_stat_task.cancel()
+    tile_executor.shutdown(wait=True)
+    TileService.close_dataset()
 
 @app.get("/")
 async def root():
     """Root endpoint with server information."""
-    tiff_exists = Path(TIFF_FILE).exists()
-    logger.info(f"Root endpoint accessed, TIFF file exists: {tiff_exists}")
+    exists = tiff_exists()
+    logger.info(f"Root endpoint accessed, TIFF file exists: {exists}")
     
-    return {
-        "server": "GeoTIFF Tile Server",
-        "endpoints": {
-            "tiles": "/tiles/{z}/{x}/{y}.png",
-            "health": "/health"
-        },
-        "tiff_file": TIFF_FILE,
-        "tiff_exists": tiff_exists
-    }
+    return ROOT_RESPONSES[exists]
 
 @app.get("/tiles/{z}/{x}/{y}.png")
-async def get_tile(z: int, x: int, y: int):
+async def get_tile(z: int, x: int, y: int, request: Request):
     """Generate and serve a tile from the GeoTIFF file with original colors preserved."""
-    logger.info(f"Tile requested: z={z}, x={x}, y={y}")
+    logger.debug("Tile requested: z=%s, x=%s, y=%s", z, x, y)
     
-    tile_bytes, error = TileService.generate_tile(z, x, y)
+    loop = asyncio.get_running_loop()
+    tile_bytes, etag, error = await loop.run_in_executor(tile_executor, TileService.generate_tile, z, x, y)
     
     if error:
-        logger.error(f"Error generating tile z={z}, x={x}, y={y}: {error}")
+        logger.error("Error generating tile z=%s, x=%s, y=%s: %s", z, x, y, error)
         raise HTTPException(status_code=500, detail=error)
     
-    logger.debug(f"Serving tile: z={z}, x={x}, y={y}")    
-    return Response(content=tile_bytes, media_type="image/png")
+    # Without an ETag the tile is an empty stand-in for a failed render,
+    # which clients must not keep
+    if etag is None:
+        return Response(content=tile_bytes, media_type="image/png", headers={"Cache-Control": "no-store"})
+    
+    headers = {
+        "Cache-Control": f"public, max-age={TILE_MAX_AGE}, immutable",
+        "ETag": etag,
+    }
+    
+    # The client already has this tile, skip sending the body. If-None-Match
+    # uses weak comparison, so a W/ prefix on a listed tag is ignored.
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))):
+        logger.debug("Tile not modified: z=%s, x=%s, y=%s", z, x, y)
+        return Response(status_code=304, headers=headers)
+    
+    logger.debug("Serving tile: z=%s, x=%s, y=%s", z, x, y)
+    return Response(content=tile_bytes, media_type="image/png", headers=headers)
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint that also verifies TIFF file availability."""
-    tiff_exists = Path(TIFF_FILE).exists()
-    logger.info(f"Health check: TIFF file exists: {tiff_exists}")
+    exists = tiff_exists()
+    logger.info(f"Health check: TIFF file exists: {exists}")
     
-    if tiff_exists:
-        return {"status": "healthy", "tiff_file": TIFF_FILE, "tiff_exists": True}
-    else:
-        return {"status": "unhealthy", "tiff_file": TIFF_FILE, "tiff_exists": False}
+    return HEALTH_RESPONSES[exists]
 
 if __name__ == "__main__":
     # Validate TIFF file on startup
@@ -93,6 +163,9 @@ if __name__ == "__main__":
         logger.warning("Starting server without valid TIFF file. Some endpoints may not work correctly.")
     else:
         logger.info(f"TIFF file found at: {TIFF_FILE}")
+        # Warp once here rather than in every worker's startup
+        if PROD and PREWARP_TIFF:
+            prewarp_tiff()
     
     logger.info("Starting tile server at http://localhost:8000")
     logger.info("Try accessing:")
@@ -100,4 +173,19 @@ if __name__ == "__main__":
     logger.info("  - Sample tile: http://localhost:8000/tiles/5/10/10.png")
     
     # Run the app directly
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    if PROD:
+        # WEB_WORKERS server processes with C event loop and HTTP parser; requests are
+        # already logged by our middleware, so uvicorn's access log is off
+        logger.info(f"Production mode with {WEB_WORKERS} workers")
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=WEB_WORKERS,
+            loop="uvloop",
+            http="httptools",
+            log_config=None,
+            access_log=False,
+        )
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1,8 +1,10 @@
 """
 Middleware components for the Tile Server application.
 """
+import random
 import time
 from fastapi import Request
+from config import TILE_LOG_SAMPLE_RATE
 from logger import setup_logger
 
 # Setup logger for this module
@@ -12,6 +14,10 @@ async def log_requests(request: Request, call_next):
     """
     Middleware that logs information about HTTP requests and responses.
     
+    Tile requests are the bulk of the traffic, so successful ones are only
+    logged for a sample (TILE_LOG_SAMPLE_RATE); failed tiles and all other
+    endpoints are always logged.
+    
     Args:
         request: The incoming request
         call_next: Function to process the request
@@ -19,19 +25,28 @@ async def log_requests(request: Request, call_next):
     Returns:
         The response from the next middleware or route handler
     """
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     # Get client IP and requested path
     client_host = request.client.host if request.client else "unknown"
     path = request.url.path
+    is_tile = path.startswith("/tiles/")
     
-    logger.info(f"Request started: {request.method} {path} from {client_host}")
+    if not is_tile:
+        logger.info(f"Request started: {request.method} {path} from {client_host}")
     
     # Process the request
     response = await call_next(request)
     
+    # Successful tiles (including 304s) are only logged for the sample
+    if is_tile and response.status_code < 400 and random.random() >= TILE_LOG_SAMPLE_RATE:
+        return response
+    
     # Calculate and log processing time
-    process_time = time.time() - start_time
-    logger.info(f"Request completed: {request.method} {path} - Status: {response.status_code} - Time: {process_time:.3f}s")
+    process_time = time.perf_counter() - start_time
+    if is_tile:
+        logger.info(f"Request completed: {request.method} {path} from {client_host} - Status: {response.status_code} - Time: {process_time:.3f}s")
+    else:
+        logger.info(f"Request completed: {request.method} {path} - Status: {response.status_code} - Time: {process_time:.3f}s")
     
     return response
@@ -0,0 +1,150 @@
+"""
+One-time reprojection of the TIFF file to Web Mercator.
+
+Tiles are always served in Web Mercator, so warping the source once at startup
+turns every tile request into a plain window read instead of a full GDAL warp.
+The copy carries internal overviews, so low zoom reads are served from a
+downsampled level rather than the full resolution data.
+"""
+import os
+from pathlib import Path
+import numpy as np
+import rasterio
+import rasterio.errors
+from rasterio.crs import CRS
+from rasterio.warp import calculate_default_transform, reproject, Resampling
+from config import TIFF_FILE, WARPED_TIFF_FILE, WARP_THREADS, WARP_MEM_LIMIT
+from logger import setup_logger
+
+# Setup logger for this module
+logger = setup_logger('prewarp')
+
+WEB_MERCATOR = CRS.from_epsg(3857)
+WGS84 = CRS.from_epsg(4326)
+
+# Latitude limit of the Web Mercator projection
+MAX_LATITUDE = 85.0511287798
+
+# Internal block size of the warped copy, matching the tile size
+BLOCK_SIZE = 256
+
+def overview_factors(width, height):
+    """Overview decimation factors (2, 4, 8, ...) until a level fits in one block."""
+    factors = []
+    size = max(width, height)
+    while size > BLOCK_SIZE:
+        factors.append(2 ** (len(factors) + 1))
+        size /= 2
+    return factors
+
+def is_prewarped(src_path=TIFF_FILE, dst_path=WARPED_TIFF_FILE):
+    """Check whether an up-to-date warped copy of the TIFF file, with overviews, exists."""
+    try:
+        if os.path.getmtime(dst_path) < os.path.getmtime(src_path):
+            return False
+        with rasterio.open(dst_path) as dst:
+            # Copies written before overviews, or float copies written before
+            # they had nodata, get rebuilt
+            if np.dtype(dst.dtypes[0]).kind == "f" and dst.nodata is None:
+                return False
+            return not overview_factors(dst.width, dst.height) or bool(dst.overviews(1))
+    except (OSError, rasterio.errors.RasterioIOError):
+        return False
+
+def prewarp_tiff(src_path=TIFF_FILE, dst_path=WARPED_TIFF_FILE):
+    """
+    Reproject the TIFF file to Web Mercator and write it as a tiled GeoTIFF.
+
+    The output uses 256x256 internal blocks so tile-sized window reads hit
+    whole blocks, plus internal overviews at factors 2, 4, 8, ... down to a
+    single block. Nothing is written if an up-to-date copy already exists.
+
+    Args:
+        src_path: Path of the source TIFF file
+        dst_path: Path of the warped TIFF file to create
+
+    Returns:
+        Path of the warped file, or None if it could not be created
+    """
+    if is_prewarped(src_path, dst_path):
+        logger.info(f"Using existing Web Mercator copy: {dst_path}")
+        return dst_path
+
+    tmp_path = f"{dst_path}.{os.getpid()}.tmp"
+    try:
+        with rasterio.open(src_path) as src:
+            src_crs = src.crs if src.crs else WGS84
+            left, bottom, right, top = src.bounds
+            width, height = src.width, src.height
+
+            # Web Mercator can't represent the poles; clamp geographic sources
+            # while keeping their native resolution
+            if src_crs.is_geographic and (bottom < -MAX_LATITUDE or top > MAX_LATITUDE):
+                bottom = max(bottom, -MAX_LATITUDE)
+                top = min(top, MAX_LATITUDE)
+                height = max(1, round((top - bottom) / abs(src.res[1])))
+
+            dst_transform, dst_width, dst_height = calculate_default_transform(
+                src_crs, WEB_MERCATOR, width, height, left, bottom, right, top
+            )
+
+            profile = src.profile.copy()
+            profile.update(
+                driver="GTiff",
+                crs=WEB_MERCATOR,
+                transform=dst_transform,
+                width=dst_width,
+                height=dst_height,
+                tiled=True,
+                blockxsize=BLOCK_SIZE,
+                blockysize=BLOCK_SIZE,
+                compress="deflate",
+                BIGTIFF="IF_SAFER",
+            )
+            # Float copies mark the area outside the source as NaN nodata, so
+            # tiles show it transparent like on the on-the-fly path
+            if profile["nodata"] is None and np.dtype(profile["dtype"]).kind == "f":
+                profile["nodata"] = np.nan
+
+            logger.info(f"Warping {src_path} to Web Mercator ({dst_width}x{dst_height}), this only happens once")
+            # Colormapped rasters hold class codes, which must not be interpolated
+            resampling = Resampling.bilinear
+            with rasterio.open(tmp_path, "w", **profile) as dst:
+                if src.count == 1:
+                    try:
+                        dst.write_colormap(1, src.colormap(1))
+                        resampling = Resampling.nearest
+                    except ValueError:
+                        # Band has no color table
+                        pass
+
+                reproject(
+                    source=rasterio.band(src, range(1, src.count + 1)),
+                    destination=rasterio.band(dst, range(1, src.count + 1)),
+                    src_crs=src_crs,
+                    dst_transform=dst_transform,
+                    dst_crs=WEB_MERCATOR,
+                    resampling=resampling,
+                    dst_nodata=profile["nodata"],
+                    num_threads=WARP_THREADS,
+                    warp_mem_limit=WARP_MEM_LIMIT
+                )
+
+                # Overviews share the block size and compression of the full
+                # resolution data; class codes are again never interpolated
+                factors = overview_factors(dst_width, dst_height)
+                if factors:
+                    logger.info(f"Building overviews {factors}")
+                    overview_resampling = Resampling.nearest if resampling == Resampling.nearest else Resampling.average
+                    with rasterio.Env(GDAL_TIFF_OVR_BLOCKSIZE=BLOCK_SIZE, COMPRESS_OVERVIEW="DEFLATE"):
+                        dst.build_overviews(factors, overview_resampling)
+                    dst.update_tags(ns="rio_overview", resampling=overview_resampling.name)
+
+        os.replace(tmp_path, dst_path)
+        logger.info(f"Web Mercator copy written to: {dst_path}")
+        return dst_path
+
+    except Exception as e:
+        logger.warning(f"Could not prewarp TIFF file, tiles will be reprojected on the fly: {e}")
+        Path(tmp_path).unlink(missing_ok=True)
+        return None
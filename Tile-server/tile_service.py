@@ -2,20 +2,77 @@
 Service for processing and generating map tiles from GeoTIFF data.
 """
 import io
+import functools
+import math
+import threading
+from collections import OrderedDict
 import numpy as np
 import rasterio
+from affine import Affine
 from rasterio.warp import reproject, Resampling, transform_bounds
 from rasterio.crs import CRS
+from rasterio.vrt import WarpedVRT
 from PIL import Image
-import traceback
-from pathlib import Path
-from utils import tile_bounds, create_empty_tile
-from config import TIFF_FILE
+from utils import tile_etag, tile_bounds, tile_mercator_bounds, create_empty_tile, tiff_mtime, tiff_exists
+from config import TIFF_FILE, TILE_CACHE_BYTES, PNG_COMPRESS_LEVEL, TILE_WARP_THREADS, WARP_MEM_LIMIT
 from logger import setup_logger
 
 # Setup logger for this module
 logger = setup_logger('tile_service')
 
+class DatasetInfo:
+    """
+    Read-only metadata of the TIFF file, captured once when the dataset is opened
+    so the tile path never has to query GDAL for it again.
+    """
+    def __init__(self, src, mtime):
+        self.mtime = mtime
+        self.count = src.count
+        self.width = src.width
+        self.height = src.height
+        self.crs = src.crs
+        self.is_web_mercator = src.crs is not None and src.crs.to_epsg() == 3857
+        self.transform = src.transform
+        self.bounds = src.bounds
+        
+        # Footprint in WGS84, used to skip tiles that don't overlap the raster
+        self.bounds_wgs84 = tuple(src.bounds)
+        if src.crs and src.crs != CRS.from_epsg(4326):
+            self.bounds_wgs84 = transform_bounds(src.crs, CRS.from_epsg(4326), *src.bounds)
+        self.nodata = src.nodata
+        self.dtype = src.dtypes[0]
+        self.colormap = None
+        self.palette = None
+        if src.count == 1:
+            try:
+                self.colormap = src.colormap(1)
+            except ValueError:
+                # Band has no color table
+                pass
+        if self.colormap:
+            self.palette = DatasetInfo._build_palette(self.colormap)
+        
+        # uint8 rasters with a colormap hold class codes: pixel values are palette
+        # indices that must be neither interpolated nor stretched
+        self.categorical = self.palette is not None and self.dtype == 'uint8'
+        
+        # 8-bit RGB/RGBA imagery is already display-ready and is served as is,
+        # without a per-tile contrast stretch
+        self.rgb8 = self.dtype == 'uint8' and self.count in (3, 4)
+    
+    @staticmethod
+    def _build_palette(colormap):
+        """
+        Build a dense (256, 3) uint8 lookup table from a rasterio colormap.
+        Indices without an entry stay black, matching the old per-pixel lookup.
+        """
+        palette = np.zeros((256, 3), dtype=np.uint8)
+        for index, color in colormap.items():
+            if 0 <= index < 256:
+                palette[index] = color[:3]
+        return palette
+
+
 class TileService:
     """"
     Service for processing and generating map tiles from GeoTI
@@ -24,8 +81,154 @@ class TileService:
     WEB_MERCATOR = CRS.from_epsg(3857)
     WGS84 = CRS.from_epsg(4326)
     
+    # Dataset state shared by all requests. Metadata is cached once; every worker
+    # thread gets its own long-lived handle because GDAL handles are not thread-safe.
+    _dataset_lock = threading.Lock()
+    _dataset_path = TIFF_FILE
+    _dataset_info = None
+    _dataset_generation = 0
+    _dataset_handles = []
+    _thread_local = threading.local()
+    
+    # In-memory LRU of rendered PNG bytes keyed by (z, x, y, TIFF mtime), bounded
+    # by the total size of the PNGs (TILE_CACHE_MB). Empty tiles are cached too,
+    # so repeated out-of-bounds requests are free.
+    _tile_cache = OrderedDict()
+    _tile_cache_bytes = 0
+    _tile_cache_lock = threading.Lock()
+    
+    @classmethod
+    def open_dataset(cls, path=None):
+        """
+        Open the TIFF file and cache its metadata for the tile path.
+        
+        Args:
+            path: File to serve tiles from, e.g. a prewarped copy of the TIFF file
+                  (None keeps the current one)
+        
+        Returns:
+            DatasetInfo describing the opened TIFF file
+        """
+        with cls._dataset_lock:
+            if path is not None and path != cls._dataset_path:
+                cls._dataset_path = path
+                cls._dataset_info = None
+                cls._dataset_generation += 1
+            if cls._dataset_info is None:
+                logger.info(f"Opening TIFF file: {cls._dataset_path}")
+                with rasterio.open(cls._dataset_path) as src:
+                    cls._dataset_info = DatasetInfo(src, tiff_mtime())
+                logger.debug(f"Cached dataset metadata: {cls._dataset_info.count} bands, CRS {cls._dataset_info.crs}")
+            return cls._dataset_info
+    
+    @classmethod
+    def close_dataset(cls):
+        """Close every cached dataset handle and drop the cached metadata."""
+        with cls._dataset_lock:
+            for handle in cls._dataset_handles:
+                handle.close()
+            cls._dataset_handles = []
+            cls._dataset_info = None
+            cls._thread_local = threading.local()
+        cls.clear_tile_cache()
+    
+    @classmethod
+    def reload_dataset(cls):
+        """
+        Drop the cached metadata and rendered tiles after the TIFF file changed.
+        Worker threads reopen their handles on their next tile.
+        """
+        logger.info(f"TIFF file changed, reloading: {TIFF_FILE}")
+        with cls._dataset_lock:
+            if cls._dataset_path != TIFF_FILE:
+                # The prewarped copy is stale now; it is rebuilt on the next restart
+                logger.warning("Prewarped copy is out of date, reprojecting tiles on the fly until restart")
+                cls._dataset_path = TIFF_FILE
+            cls._dataset_info = None
+            cls._dataset_generation += 1
+        cls.clear_tile_cache()
+    
+    @classmethod
+    def clear_tile_cache(cls):
+        """Remove every rendered tile from the in-memory cache."""
+        with cls._tile_cache_lock:
+            cls._tile_cache.clear()
+            cls._tile_cache_bytes = 0
+    
+    @classmethod
+    def _get_dataset(cls):
+        """Return this thread's dataset handle, opening it on first use."""
+        src = getattr(cls._thread_local, 'src', None)
+        if src is not None and cls._thread_local.generation != cls._dataset_generation:
+            # Dataset was reloaded since this handle was opened
+            with cls._dataset_lock:
+                cls._dataset_handles.remove(src)
+            src.close()
+            src = None
+        if src is None:
+            logger.debug(f"Opening TIFF file handle for thread {threading.current_thread().name}")
+            src = rasterio.open(cls._dataset_path, sharing=False)
+            with cls._dataset_lock:
+                cls._dataset_handles.append(src)
+            cls._thread_local.src = src
+            cls._thread_local.generation = cls._dataset_generation
+        return src
+    
     @staticmethod
     def generate_tile(z: int, x: int, y: int):
+        """
+        Return a tile from the in-memory cache, rendering it on a miss.
+        
+        The ETag is computed once per render and cached along with the bytes.
+        
+        Args:
+            z: Zoom level
+            x: X coordinate
+            y: Y coordinate
+            
+        Returns:
+            Tuple of (tile_bytes, etag, error_message)
+            If successful, error_message will be None
+            If error occurs, tile_bytes and etag will be None and error_message will contain the error
+            The empty tile served after a failed render has no etag, since it must not be cached
+        """
+        mtime = tiff_mtime()
+        info = TileService._dataset_info
+        if info is not None and info.mtime != mtime:
+            TileService.reload_dataset()
+        
+        key = (z, x, y, mtime)
+        with TileService._tile_cache_lock:
+            cached = TileService._tile_cache.get(key)
+            if cached is not None:
+                TileService._tile_cache.move_to_end(key)
+        if cached is not None:
+            logger.debug("Tile cache hit: z=%s, x=%s, y=%s", z, x, y)
+            return (*cached, None)
+        
+        tile_bytes, error, cacheable = TileService._render_tile(z, x, y)
+        if error is not None:
+            return None, None, error
+        if not cacheable:
+            return tile_bytes, None, None
+        etag = tile_etag(tile_bytes)
+        
+        # Only cache successful renders of a file that exists
+        if mtime is not None and len(tile_bytes) <= TILE_CACHE_BYTES:
+            with TileService._tile_cache_lock:
+                # Another thread may have rendered the same tile meanwhile
+                previous = TileService._tile_cache.pop(key, None)
+                if previous is not None:
+                    TileService._tile_cache_bytes -= len(previous[0])
+                TileService._tile_cache[key] = (tile_bytes, etag)
+                TileService._tile_cache_bytes += len(tile_bytes)
+                while TileService._tile_cache_bytes > TILE_CACHE_BYTES:
+                    evicted, _ = TileService._tile_cache.popitem(last=False)[1]
+                    TileService._tile_cache_bytes -= len(evicted)
+        return tile_bytes, etag, None
+    
+    @staticmethod
+    def _render_tile(z: int, x: int, y: int):
         """
         Generate a tile from the GeoTIFF file with original colors preserved.
         
@@ -35,120 +238,288 @@ class TileService:
             y: Y coordinate
             
         Returns:
-            Tuple of (tile_bytes, error_message)
+            Tuple of (tile_bytes, error_message, cacheable)
             If successful, error_message will be None
             If error occurs, tile_bytes will be None and error_message will contain the error
+            cacheable is False for the empty tile returned when rendering failed
         """
-        logger.info(f"Generating tile with coordinates z={z}, x={x}, y={y}")
+        logger.debug("Generating tile with coordinates z=%s, x=%s, y=%s", z, x, y)
         
-        if not Path(TIFF_FILE).exists():
+        if not tiff_exists():
             error_msg = f"TIFF file not found at path: {TIFF_FILE}. Please check the server configuration."
             logger.error(error_msg)
-            return None, error_msg
+            return None, error_msg, False
             
         try:
-            logger.debug(f"Opening TIFF file: {TIFF_FILE}")
-            with rasterio.open(TIFF_FILE) as src:
-                # Get the bounds of the requested tile in WGS84
-                lon_west, lat_south, lon_east, lat_north = tile_bounds(x, y, z)
-                logger.debug(f"Tile bounds (WGS84): {lon_west}, {lat_south}, {lon_east}, {lat_north}")
-                
-                # Determine the source CRS - assume WGS84 if none is specified
-                src_crs = src.crs if src.crs else TileService.WGS84
-                logger.debug(f"Source CRS: {src_crs}")
-                
-                # Convert tile bounds to Web Mercator for proper display
-                west, south, east, north = transform_bounds(
-                    TileService.WGS84,  # Input is in WGS84 from tile_bounds
-                    TileService.WEB_MERCATOR,  # Output in Web Mercator
-                    lon_west, lat_south, lon_east, lat_north
-                )
-                
-                # Create a target image with the right dimensions
-                width, height = 256, 256
-                
-                # Define the transformation for this tile in Web Mercator
-                dst_transform = rasterio.transform.from_bounds(
-                    west, south, east, north, width, height
-                )
-                
-                # Get the number of bands from the source
-                band_count = src.count
-                logger.debug(f"Source has {band_count} bands")
-                
-                # Create arrays for our target data - one for each band
-                dst_shape = (band_count, height, width)
-                dst_data = np.zeros(dst_shape, dtype=rasterio.float32)
-                
-                # Select resampling method based on zoom level
+            info = TileService.open_dataset()
+            src = TileService._get_dataset()
+            # Get the bounds of the requested tile in WGS84 and its Web Mercator transform
+            (lon_west, lat_south, lon_east, lat_north), dst_transform = TileService._tile_geometry(z, x, y)
+            logger.debug("Tile bounds (WGS84): %s, %s, %s, %s", lon_west, lat_south, lon_east, lat_north)
+            
+            # Skip the read entirely for tiles outside the raster footprint
+            if not TileService._tile_overlaps(info, lon_west, lat_south, lon_east, lat_north):
+                logger.debug("Tile doesn't overlap with source data, returning empty tile")
+                return create_empty_tile(), None, True
+            
+            # Determine the source CRS - assume WGS84 if none is specified
+            src_crs = info.crs if info.crs else TileService.WGS84
+            logger.debug("Source CRS: %s", src_crs)
+            
+            # Create a target image with the right dimensions
+            width, height = 256, 256
+            
+            # Get the number of bands from the source
+            band_count = info.count
+            logger.debug("Source has %s bands", band_count)
+            
+            # Create arrays for our target data - one for each band the image uses
+            indexes = list(range(1, TileService._bands_needed(band_count) + 1))
+            dst_shape = (len(indexes), height, width)
+            dst_dtype = np.uint8 if info.categorical or info.rgb8 else np.float32
+            dst_data = TileService._scratch_buffer('dst', dst_shape, dst_dtype)
+            
+            # Select resampling method based on zoom level (class codes can't be averaged)
+            if info.categorical:
+                resampling_method = Resampling.nearest
+            else:
                 resampling_method = TileService._get_resampling_for_zoom(z)
-                logger.debug(f"Using resampling method: {resampling_method}")
-                
-                try:
-                    # Reproject the data from the source CRS to Web Mercator
+            logger.debug("Using resampling method: %s", resampling_method)
+            
+            try:
+                if info.is_web_mercator:
+                    # Already in Web Mercator (e.g. the prewarped copy), no warp needed
+                    logger.debug("Reading Web Mercator window...")
+                    TileService._read_window(src, info, indexes, dst_transform, dst_data, resampling_method)
+                else:
+                    # Read only the source pixels under the tile, then reproject
+                    # them from the source CRS to Web Mercator
                     logger.debug("Reprojecting data...")
+                    src_data, src_transform = TileService._read_source_window(
+                        src, info, indexes, src_crs, (lon_west, lat_south, lon_east, lat_north),
+                        width, height, resampling_method
+                    )
+                    if src_data is None:
+                        logger.debug("Tile doesn't overlap with source pixels, returning empty tile")
+                        return create_empty_tile(), None, True
                     reproject(
-                        source=rasterio.band(src, range(1, band_count + 1)),
+                        source=src_data,
                         destination=dst_data,
-                        src_transform=src.transform,
+                        src_transform=src_transform,
                         src_crs=src_crs,
                         dst_transform=dst_transform,
                         dst_crs=TileService.WEB_MERCATOR,  # Always use Web Mercator for output
-                        resampling=resampling_method
+                        resampling=resampling_method,
+                        # Let the warper mark nodata (and uncovered) pixels as NaN;
+                        # 8-bit data keeps the raster's own nodata value
+                        src_nodata=info.nodata,
+                        dst_nodata=info.nodata if dst_dtype == np.uint8 else np.nan,
+                        num_threads=TILE_WARP_THREADS,
+                        warp_mem_limit=WARP_MEM_LIMIT
                     )
-                except Exception as e:
-                    logger.warning(f"Reprojection error: {e}")
-                    logger.debug(f"Tile coordinates: z={z}, x={x}, y={y}")
-                    logger.debug(f"Source CRS: {src_crs}")
-                    logger.debug(f"Bounds (WGS84): {lon_west}, {lat_south}, {lon_east}, {lat_north}")
-                    
-                    # Try alternative approach for low zoom levels where standard reprojection might fail
-                    if z < 5:
-                        logger.info(f"Attempting alternative low-zoom rendering for z={z}")
-                        return TileService._generate_low_zoom_tile(src, z, x, y, src_crs)
-                    else:
-                        # If reprojection fails, return an empty tile
-                        logger.warning("Reprojection failed, returning empty tile")
-                        return create_empty_tile(), None
-                
-                # Handle nodata values
-                if hasattr(src, 'nodata') and src.nodata is not None:
-                    logger.debug(f"Handling nodata values: {src.nodata}")
-                    for i in range(band_count):
-                        mask = dst_data[i] == src.nodata
-                        dst_data[i] = np.ma.array(dst_data[i], mask=mask)
-                
-                # Check for empty data
-                if np.all(np.isnan(dst_data)) or dst_data.size == 0:
-                    logger.debug("Empty data detected, returning empty tile")
-                    return create_empty_tile(), None
+            except Exception as e:
+                logger.warning("Reprojection error: %s", e)
+                logger.debug("Tile coordinates: z=%s, x=%s, y=%s", z, x, y)
+                logger.debug("Source CRS: %s", src_crs)
+                logger.debug("Bounds (WGS84): %s, %s, %s, %s", lon_west, lat_south, lon_east, lat_north)
                 
-                # Clean data: Replace NaNs and infinities
-                logger.debug("Cleaning data (replace NaNs and infinities)")
-                dst_data = np.nan_to_num(dst_data)
-                
-                # Special handling for low zoom levels to reduce distortion
+                # Try alternative approach for low zoom levels where standard reprojection might fail
                 if z < 5:
-                    logger.debug(f"Applying low-zoom adjustments for z={z}")
-                    dst_data = TileService._adjust_for_low_zoom(dst_data, z, lat_south, lat_north)
-                
-                # Process based on band count and create the appropriate image
-                logger.debug(f"Processing {band_count} bands to create image")
-                img = TileService._process_bands(src, dst_data, band_count, height, width)
-                
-                # Save to PNG
-                img_bytes = io.BytesIO()
-                img.save(img_bytes, format="PNG")
-                img_bytes.seek(0)
-                
-                logger.info(f"Successfully generated tile z={z}, x={x}, y={y}")
-                return img_bytes.getvalue(), None
-        
+                    logger.debug("Attempting alternative low-zoom rendering for z=%s", z)
+                    return TileService._generate_low_zoom_tile(src, info, z, x, y, src_crs)
+                else:
+                    # If reprojection fails, return an empty tile
+                    logger.warning("Reprojection failed, returning empty tile")
+                    return create_empty_tile(), None, False
+            
+            empty, nodata_mask = TileService._check_data(info, dst_data)
+            if empty:
+                logger.debug("Empty data detected, returning empty tile")
+                return create_empty_tile(), None, True
+            
+            # Special handling for low zoom levels to reduce distortion
+            if z < 5 and dst_dtype == np.float32:
+                logger.debug("Applying low-zoom adjustments for z=%s", z)
+                dst_data = TileService._adjust_for_low_zoom(dst_data, z, lat_south, lat_north)
+            
+            # Process based on band count and create the appropriate image
+            logger.debug("Processing %s bands to create image", band_count)
+            img = TileService._process_bands(info, dst_data, band_count, height, width, nodata_mask)
+            
+            logger.debug("Successfully generated tile z=%s, x=%s, y=%s", z, x, y)
+            return TileService._encode_png(img), None, True
+    
         except Exception as e:
-            error_details = f"Error generating tile: {str(e)}"
-            logger.error(error_details)
-            logger.debug(traceback.format_exc())
-            return None, str(e)
+            # Traceback is only formatted if the record is actually emitted
+            logger.exception("Error generating tile z=%s x=%s y=%s", z, x, y)
+            return None, str(e), False
+    
+    @staticmethod
+    def _check_data(info, dst_data):
+        """
+        Check a read tile for empty data and mask out its invalid pixels.
+        
+        8-bit imagery is empty when fully transparent, or all black for RGB;
+        float data when nothing is finite. NaNs and infinities are replaced so
+        they don't count towards the stretch; tiles fully inside the data skip
+        this entirely.
+        
+        Returns:
+            Tuple of (empty, nodata_mask) as used by _process_bands
+        """
+        if info.rgb8:
+            return not (dst_data[3] if info.count == 4 else dst_data).any(), None
+        if dst_data.dtype == np.uint8:
+            # Class codes can't be NaN
+            return dst_data.size == 0, None
+        
+        finite = np.isfinite(dst_data)
+        if not finite.any():
+            return True, None
+        if finite.all():
+            return False, None
+        logger.debug("Cleaning data (replace NaNs and infinities)")
+        return False, TileService._mask_invalid(dst_data, finite)
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def _tile_geometry(z, x, y):
+        """
+        Compute the WGS84 bounds and Web Mercator transform of a tile.
+        
+        Both are pure functions of (z, x, y) and clients request the same tiles
+        over and over while panning, so results are memoized.
+        
+        Returns:
+            Tuple of ((lon_west, lat_south, lon_east, lat_north), dst_transform)
+        """
+        bounds = tile_bounds(x, y, z)
+        
+        # Web Mercator bounds come straight from the tile grid, no PROJ call needed
+        west, south, east, north = tile_mercator_bounds(x, y, z)
+        
+        # Define the transformation for this tile in Web Mercator
+        dst_transform = rasterio.transform.from_bounds(west, south, east, north, 256, 256)
+        return bounds, dst_transform
+    
+    @staticmethod
+    def _tile_overlaps(info, lon_west, lat_south, lon_east, lat_north):
+        """Check whether tile bounds (WGS84) intersect the raster footprint."""
+        src_west, src_south, src_east, src_north = info.bounds_wgs84
+        if lat_north < src_south or lat_south > src_north:
+            return False
+        if src_west > src_east:
+            # Footprint crosses the antimeridian: [west, 180] plus [-180, east]
+            return lon_east >= src_west or lon_west <= src_east
+        return not (lon_east < src_west or lon_west > src_east)
+    
+    @staticmethod
+    def _read_window(src, info, indexes, dst_transform, dst_data, resampling_method):
+        """
+        Read a tile from a dataset that is already in Web Mercator.
+        
+        The tile is a plain (resampled) window read; only tiles that reach past
+        the raster edge need the slower boundless read.
+        """
+        height, width = dst_data.shape[1:]
+        window = rasterio.windows.from_bounds(
+            *rasterio.transform.array_bounds(height, width, dst_transform),
+            transform=info.transform
+        )
+        inside = (
+            window.col_off >= 0 and window.row_off >= 0 and
+            window.col_off + window.width <= info.width and
+            window.row_off + window.height <= info.height
+        )
+        # Pixels past the raster edge and nodata become NaN in float tiles, like the
+        # warper makes them on the reprojection path
+        is_float = dst_data.dtype == np.float32
+        src.read(
+            indexes, out=dst_data, window=window, resampling=resampling_method,
+            boundless=not inside, fill_value=np.nan if is_float else None
+        )
+        if info.nodata is not None and is_float:
+            np.copyto(dst_data, np.nan, where=dst_data == info.nodata)
+    
+    @staticmethod
+    def _read_source_window(src, info, indexes, src_crs, bounds, width, height, resampling_method):
+        """
+        Read the part of the source raster under a tile, for reprojection.
+        
+        The tile's WGS84 bounds are taken into the source CRS and padded by a few
+        pixels for the resampling kernel. Only that window is read, so the
+        warper never touches blocks outside the tile. At low zooms the window is
+        decimated on read to about twice the tile size (using overviews when the
+        file has them) instead of warping full resolution data.
+        
+        Args:
+            src: Open rasterio dataset
+            info: DatasetInfo of the dataset
+            indexes: Band indexes to read
+            src_crs: CRS of the source data
+            bounds: Tile bounds in WGS84 (west, south, east, north)
+            width: Tile width in pixels
+            height: Tile height in pixels
+            resampling_method: Resampling used when decimating
+        
+        Returns:
+            Tuple of (array, transform) for the window, or (None, None) if the
+            tile doesn't cover any source pixels
+        """
+        if src_crs != TileService.WGS84:
+            bounds = transform_bounds(TileService.WGS84, src_crs, *bounds)
+        window = rasterio.windows.from_bounds(*bounds, transform=info.transform)
+        
+        # Whole pixels, padded for the resampling kernel and clipped to the raster
+        pad = 2
+        col_start = max(0, math.floor(window.col_off) - pad)
+        row_start = max(0, math.floor(window.row_off) - pad)
+        col_stop = min(info.width, math.ceil(window.col_off + window.width) + pad)
+        row_stop = min(info.height, math.ceil(window.row_off + window.height) + pad)
+        if col_stop <= col_start or row_stop <= row_start:
+            return None, None
+        window = rasterio.windows.Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+        
+        # Decimate on read when the window is much larger than the tile
+        factor = max(1.0, window.width / (2 * width), window.height / (2 * height))
+        out_width = max(1, round(window.width / factor))
+        out_height = max(1, round(window.height / factor))
+        
+        src_data = src.read(
+            indexes,
+            window=window,
+            out_shape=(len(indexes), out_height, out_width),
+            resampling=resampling_method
+        )
+        src_transform = rasterio.windows.transform(window, info.transform) * Affine.scale(
+            window.width / out_width, window.height / out_height
+        )
+        return src_data, src_transform
+    
+    @classmethod
+    def _scratch_buffer(cls, name, shape, dtype):
+        """
+        Return a zeroed per-thread buffer, reallocating only when shape or dtype change.
+        Saves a fresh allocation and page-faulting memset on every tile.
+        """
+        buf = getattr(cls._thread_local, name, None)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.zeros(shape, dtype=dtype)
+            setattr(cls._thread_local, name, buf)
+        else:
+            buf.fill(0)
+        return buf
+    
+    @staticmethod
+    def _encode_png(img):
+        """
+        Encode an image as PNG bytes.
+        Uses a lower zlib level than Pillow's default, since encoding is one of
+        the largest per-tile CPU costs.
+        """
+        img_bytes = io.BytesIO()
+        img.save(img_bytes, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+        return img_bytes.getvalue()
     
     @staticmethod
     def _get_resampling_for_zoom(zoom_level):
@@ -193,190 +564,194 @@ class TileService:
         return data
     
     @staticmethod
-    def _generate_low_zoom_tile(src, z, x, y, src_crs):
+    def _generate_low_zoom_tile(src, info, z, x, y, src_crs):
         """
         Alternative tile generation method for very low zoom levels.
         Uses simplified rendering to avoid extreme distortion.
+        
+        The tile is read through a WarpedVRT with the tile's own Web Mercator
+        grid, so GDAL picks a matching overview and only reads the blocks under
+        the tile instead of decoding the full raster.
+        
+        Returns the same (tile_bytes, error_message, cacheable) tuple as _render_tile.
         """
-        logger.info(f"Using low-zoom tile generation for z={z}, x={x}, y={y}")
+        logger.debug("Using low-zoom tile generation for z=%s, x=%s, y=%s", z, x, y)
         try:
-            # Get tile bounds in WGS84
-            lon_west, lat_south, lon_east, lat_north = tile_bounds(x, y, z)
-            logger.debug(f"Low-zoom tile bounds (WGS84): {lon_west}, {lat_south}, {lon_east}, {lat_north}")
+            # Get tile bounds in WGS84 and the tile's Web Mercator transform
+            (lon_west, lat_south, lon_east, lat_north), dst_transform = TileService._tile_geometry(z, x, y)
+            logger.debug("Low-zoom tile bounds (WGS84): %s, %s, %s, %s", lon_west, lat_south, lon_east, lat_north)
             
             # Target dimensions
             width, height = 256, 256
             
-            # Get source bounds in WGS84 for comparison
-            src_bounds_wgs84 = src.bounds
-            if src_crs != TileService.WGS84:
-                src_bounds_wgs84 = transform_bounds(
-                    src_crs, TileService.WGS84, *src.bounds
-                )
-            
             # Check for overlap between tile and source
-            if (lon_east < src_bounds_wgs84[0] or lon_west > src_bounds_wgs84[2] or 
-                lat_north < src_bounds_wgs84[1] or lat_south > src_bounds_wgs84[3]):
+            if not TileService._tile_overlaps(info, lon_west, lat_south, lon_east, lat_north):
                 logger.debug("Tile doesn't overlap with source data, returning empty tile")
-                return create_empty_tile(), None
+                return create_empty_tile(), None, True
                 
             # For very low zoom, create a simpler representation
-            band_count = src.count
-            logger.debug(f"Creating simplified tile with {band_count} bands")
+            band_count = info.count
+            logger.debug("Creating simplified tile with %s bands", band_count)
             
-            if band_count == 1:
-                # For single-band rasters, create a grayscale image
-                img_data = np.zeros((height, width), dtype=np.uint8)
-                
-                # Read a downsampled version of the source data
-                overview_level = min(z, src.overviews(1) or [0])
-                logger.debug(f"Using overview level: {overview_level}")
-                source_data = src.read(1, out_shape=(1, height, width), resampling=Resampling.average)
-                
-                # Normalize to 0-255 range
-                if source_data.size > 0:
-                    min_val = np.min(source_data)
-                    max_val = np.max(source_data)
-                    logger.debug(f"Source data range: {min_val} to {max_val}")
-                    if max_val > min_val:
-                        img_data = np.clip(
-                            ((source_data - min_val) / (max_val - min_val) * 255).astype(np.uint8),
-                            0, 255
-                        )
-                
-                # Create image from the data
-                img = Image.fromarray(img_data, mode='L')
-            else:
-                # For multi-band rasters, create an RGB image
-                img_data = np.zeros((height, width, min(3, band_count)), dtype=np.uint8)
-                
-                # Process up to 3 bands (RGB)
-                for i in range(min(3, band_count)):
-                    source_data = src.read(i+1, out_shape=(1, height, width), resampling=Resampling.average)
-                    
-                    if source_data.size > 0:
-                        min_val = np.min(source_data)
-                        max_val = np.max(source_data)
-                        logger.debug(f"Band {i+1} data range: {min_val} to {max_val}")
-                        if max_val > min_val:
-                            img_data[:, :, i] = np.clip(
-                                ((source_data - min_val) / (max_val - min_val) * 255).astype(np.uint8),
-                                0, 255
-                            )
-                
-                # Create image from the data
-                img = Image.fromarray(img_data, mode='RGB' if band_count >= 3 else 'L')
+            # Read the tile from a virtual warped dataset on the tile grid, averaged
+            # unless it holds class codes. Like the main path, 8-bit data keeps its
+            # nodata value and everything else is read as float with NaN nodata.
+            indexes = list(range(1, TileService._bands_needed(band_count) + 1))
+            dst_dtype = np.uint8 if info.categorical or info.rgb8 else np.float32
+            with WarpedVRT(
+                src,
+                src_crs=src_crs,
+                crs=TileService.WEB_MERCATOR,
+                transform=dst_transform,
+                width=width,
+                height=height,
+                resampling=Resampling.nearest if info.categorical else Resampling.average,
+                src_nodata=info.nodata,
+                nodata=info.nodata if dst_dtype == np.uint8 else np.nan,
+                dtype=np.dtype(dst_dtype).name
+            ) as vrt:
+                tile_data = vrt.read(indexes)
             
-            # Save to PNG
-            img_bytes = io.BytesIO()
-            img.save(img_bytes, format="PNG")
-            img_bytes.seek(0)
+            empty, nodata_mask = TileService._check_data(info, tile_data)
+            if empty:
+                logger.debug("Empty data detected, returning empty tile")
+                return create_empty_tile(), None, True
             
-            logger.info(f"Successfully generated low-zoom tile z={z}, x={x}, y={y}")
-            return img_bytes.getvalue(), None
+            # Same band handling as the main path (palette, 8-bit passthrough, stretch)
+            img = TileService._process_bands(info, tile_data, band_count, height, width, nodata_mask)
+            
+            logger.debug("Successfully generated low-zoom tile z=%s, x=%s, y=%s", z, x, y)
+            return TileService._encode_png(img), None, True
         
-        except Exception as e:
-            error_msg = f"Error generating low zoom tile: {str(e)}"
-            logger.error(error_msg)
-            logger.debug(traceback.format_exc())
-            return create_empty_tile(), None
+        except Exception:
+            logger.exception("Error generating low zoom tile z=%s x=%s y=%s", z, x, y)
+            return create_empty_tile(), None, False
     
     @staticmethod
-    def _process_bands(src, dst_data, band_count, height, width):
-        """Process bands based on count and create appropriate image."""
+    def _bands_needed(band_count):
+        """Number of leading bands _process_bands actually uses for a given band count."""
+        if band_count in (1, 3, 4):
+            return band_count
+        return min(3, band_count)
+    
+    @staticmethod
+    def _mask_invalid(data, finite):
+        """
+        Replace non-finite (nodata) values of a float tile so the stretch ignores them.
+        
+        Each band's invalid pixels are set to that band's smallest valid value, so
+        the per-band ranges cover valid data only and nodata maps to 0.
+        
+        Args:
+            data: (bands, height, width) float array, modified in place
+            finite: Boolean array of the same shape, True where data is finite
+        
+        Returns:
+            (height, width) boolean mask of pixels without any valid band, or None
+            if there are none
+        """
+        for i in range(data.shape[0]):
+            band_valid = finite[i]
+            if band_valid.all():
+                continue
+            fill = data[i][band_valid].min() if band_valid.any() else 0
+            np.copyto(data[i], fill, where=~band_valid)
+        
+        nodata_mask = ~finite.any(axis=0)
+        return nodata_mask if nodata_mask.any() else None
+    
+    @staticmethod
+    def _process_bands(info, dst_data, band_count, height, width, nodata_mask=None):
+        """
+        Process bands based on count and create appropriate image.
+        Pixels set in nodata_mask are made transparent.
+        """
         if band_count == 1:
-            return TileService._process_single_band(src, dst_data, height, width)
+            return TileService._process_single_band(info, dst_data, height, width, nodata_mask)
         elif band_count == 3:
-            return TileService._process_rgb_bands(dst_data, height, width)
+            return TileService._process_color_bands(dst_data, 3, 'RGB', height, width, nodata_mask)
         elif band_count == 4:
-            return TileService._process_rgba_bands(dst_data, height, width)
+            return TileService._process_color_bands(dst_data, 4, 'RGBA', height, width, nodata_mask)
         else:
-            return TileService._process_multiband(dst_data, band_count, height, width)
+            # Use the first three bands as RGB
+            return TileService._process_color_bands(dst_data, min(3, band_count), 'RGB', height, width, nodata_mask)
     
     @staticmethod
-    def _process_single_band(src, dst_data, height, width):
-        """Process a single band image, applying colormap if available."""
-        if hasattr(src, 'colormap') and src.colormap(1):
-            # Use the colormap
-            colormap = src.colormap(1)
-            rgb_data = np.zeros((height, width, 3), dtype=np.uint8)
-            
-            # Scale data to the range of colormap indices
-            min_val = np.min(dst_data[0])
-            max_val = np.max(dst_data[0])
-            if max_val > min_val:
-                scaled_data = np.clip(
-                    ((dst_data[0] - min_val) / (max_val - min_val) * 255).astype(np.uint8),
-                    0, 255
-                )
-            else:
-                scaled_data = np.zeros((height, width), dtype=np.uint8)
-            
-            # Apply colormap
-            for i in range(height):
-                for j in range(width):
-                    pixel_value = scaled_data[i, j]
-                    if pixel_value in colormap:
-                        rgb_data[i, j] = [colormap[pixel_value][0], 
-                                        colormap[pixel_value][1], 
-                                        colormap[pixel_value][2]]
-            
-            return Image.fromarray(rgb_data, mode='RGB')
-        else:
-            # No colormap, create a grayscale image
-            min_val = np.min(dst_data[0])
-            max_val = np.max(dst_data[0])
-            if max_val > min_val:
-                img_data = np.clip(
-                    ((dst_data[0] - min_val) / (max_val - min_val) * 255).astype(np.uint8),
-                    0, 255
-                )
-            else:
-                img_data = np.zeros((height, width), dtype=np.uint8)
-            
-            return Image.fromarray(img_data, mode='L')
-    
-    @staticmethod
-    def _process_rgb_bands(dst_data, height, width):
-        """Process RGB (3-band) image data."""
-        rgb_data = np.zeros((height, width, 3), dtype=np.uint8)
-        for i in range(3):
-            min_val = np.min(dst_data[i])
-            max_val = np.max(dst_data[i])
-            if max_val > min_val:
-                rgb_data[:, :, i] = np.clip(
-                    ((dst_data[i] - min_val) / (max_val - min_val) * 255).astype(np.uint8),
-                    0, 255
-                )
-        
-        return Image.fromarray(rgb_data, mode='RGB')
+    def _stretch_bands(bands):
+        """
+        Stretch each band of a (bands, height, width) float stack to 0-255, in place.
+        
+        The per-band ranges come from one reduction call over the stack, and the
+        subtract and multiply are one ufunc call each over the whole cube with the
+        per-band values broadcast, so there is no Python loop over bands and no
+        temporaries. No clip is needed: each band is scaled by its own range, so
+        results already lie in [0, 255]. Constant bands, common in tiles that are
+        mostly nodata, get a scale of 0 and come out as zeros.
+        """
+        mins = bands.min(axis=(1, 2), keepdims=True)
+        ranges = bands.max(axis=(1, 2), keepdims=True) - mins
+        scales = np.divide(255.0, ranges, out=np.zeros_like(ranges), where=ranges > 0)
+        np.subtract(bands, mins, out=bands)
+        np.multiply(bands, scales, out=bands)
     
     @staticmethod
-    def _process_rgba_bands(dst_data, height, width):
-        """Process RGBA (4-band) image data."""
-        rgba_data = np.zeros((height, width, 4), dtype=np.uint8)
-        for i in range(4):
-            min_val = np.min(dst_data[i])
-            max_val = np.max(dst_data[i])
-            if max_val > min_val:
-                rgba_data[:, :, i] = np.clip(
-                    ((dst_data[i] - min_val) / (max_val - min_val) * 255).astype(np.uint8),
-                    0, 255
-                )
-        
-        return Image.fromarray(rgba_data, mode='RGBA')
+    def _process_single_band(info, dst_data, height, width, nodata_mask=None):
+        """Process a single band image, applying colormap if available."""
+        if info.categorical:
+            # Pixel values already are colormap indices
+            img_data = dst_data[0]
+        else:
+            # Scale data to the range of colormap indices (or grey levels)
+            img_data = TileService._scratch_buffer('gray', (height, width), np.uint8)
+            TileService._stretch_bands(dst_data[:1])
+            np.copyto(img_data, dst_data[0], casting='unsafe')
+        
+        if nodata_mask is not None:
+            # Palette and grey images have no per-pixel alpha; expand to add one
+            if info.palette is not None:
+                rgba = TileService._scratch_buffer('rgba', (height, width, 4), np.uint8)
+                np.take(info.palette, img_data, axis=0, out=rgba[:, :, :3])
+                rgba[:, :, 3] = 255
+                rgba[nodata_mask, 3] = 0
+                return Image.fromarray(rgba, mode='RGBA')
+            gray_alpha = TileService._scratch_buffer('la', (height, width, 2), np.uint8)
+            gray_alpha[:, :, 0] = img_data
+            gray_alpha[:, :, 1] = 255
+            gray_alpha[nodata_mask, 1] = 0
+            return Image.fromarray(gray_alpha, mode='LA')
+        
+        if info.palette is not None:
+            # Apply colormap as an 8-bit palette image; the PNG stores one byte
+            # per pixel plus the palette instead of expanded RGB
+            img = Image.fromarray(img_data, mode='P')
+            img.putpalette(info.palette.tobytes())
+            return img
+        
+        # No colormap, create a grayscale image
+        return Image.fromarray(img_data, mode='L')
     
     @staticmethod
-    def _process_multiband(dst_data, band_count, height, width):
-        """Process multi-band data using the first three bands as RGB."""
-        rgb_data = np.zeros((height, width, 3), dtype=np.uint8)
-        for i in range(min(3, band_count)):
-            min_val = np.min(dst_data[i])
-            max_val = np.max(dst_data[i])
-            if max_val > min_val:
-                rgb_data[:, :, i] = np.clip(
-                    ((dst_data[i] - min_val) / (max_val - min_val) * 255).astype(np.uint8),
-                    0, 255
-                )
-        
-        return Image.fromarray(rgb_data, mode='RGB')
+    def _process_color_bands(dst_data, channels, mode, height, width, nodata_mask=None):
+        """
+        Process RGB/RGBA image data from the first `channels` bands.
+        
+        Float bands are stretched in place in their (bands, H, W) layout, then
+        cast and interleaved into the HWC image in a single copy rather than one
+        strided write per channel. 8-bit bands are interleaved unchanged.
+        Missing channels (2-band rasters) stay zero. With a nodata mask, RGB
+        becomes RGBA so those pixels can be transparent.
+        """
+        if nodata_mask is not None and mode == 'RGB':
+            mode = 'RGBA'
+            img_data = TileService._scratch_buffer('rgba', (height, width, 4), np.uint8)
+            img_data[:, :, 3] = 255
+        else:
+            img_data = TileService._scratch_buffer(mode.lower(), (height, width, len(mode)), np.uint8)
+        bands = dst_data[:channels]
+        if bands.dtype != np.uint8:
+            TileService._stretch_bands(bands)
+        np.copyto(img_data[:, :, :channels], bands.transpose(1, 2, 0), casting='unsafe')
+        if nodata_mask is not None:
+            img_data[nodata_mask, 3] = 0
+        
+        return Image.fromarray(img_data, mode=mode)
@@ -1,10 +1,12 @@
 """
 Utility functions for the tile server.
 """
+import hashlib
 import math
+import time
 from pathlib import Path
 import os
-from config import TIFF_FILE
+from config import TIFF_FILE, TIFF_STAT_INTERVAL
 from logger import setup_logger
 
 # Setup logger for this module
@@ -22,6 +24,37 @@ def validate_tiff_file():
     logger.info(f"TIFF file validated at path: {TIFF_FILE}")
     return True
 
+# Last known modification time of the TIFF file and when it was checked
+_tiff_mtime = None
+_tiff_mtime_checked = None
+
+def refresh_tiff_stat():
+    """Stat the TIFF file now and update the cached modification time."""
+    global _tiff_mtime, _tiff_mtime_checked
+    try:
+        _tiff_mtime = os.stat(TIFF_FILE).st_mtime
+    except OSError:
+        _tiff_mtime = None
+    _tiff_mtime_checked = time.monotonic()
+    return _tiff_mtime
+
+def tiff_mtime():
+    """
+    Return the modification time of the TIFF file, or None if it is missing.
+    The file is only stat-ed once every TIFF_STAT_INTERVAL seconds.
+    """
+    if _tiff_mtime_checked is None or time.monotonic() - _tiff_mtime_checked >= TIFF_STAT_INTERVAL:
+        return refresh_tiff_stat()
+    return _tiff_mtime
+
+def tiff_exists():
+    """Check whether the TIFF file exists, using the cached stat result."""
+    return tiff_mtime() is not None
+
+def tile_etag(tile_bytes):
+    """Return a strong ETag for the given tile bytes."""
+    return f'"{hashlib.blake2b(tile_bytes, digest_size=8).hexdigest()}"'
+
 def tile_bounds(x, y, z):
     """Convert tile coordinates (x, y, z) to geospatial bounds."""
     n = 2.0 ** z
@@ -31,8 +64,23 @@ def tile_bounds(x, y, z):
     lat_bottom = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
     return lon_left, lat_bottom, lon_right, lat_top
 
-def create_empty_tile():
-    """Create an empty transparent tile and return its bytes."""
+# Half the width of the Web Mercator world (pi * Earth radius), in meters
+WEB_MERCATOR_HALF_WORLD = math.pi * 6378137.0
+
+def tile_mercator_bounds(x, y, z):
+    """
+    Convert tile coordinates (x, y, z) to Web Mercator (EPSG:3857) bounds.
+    Closed-form tile math, so no coordinate transform is needed.
+    """
+    size = 2 * WEB_MERCATOR_HALF_WORLD / 2.0 ** z
+    west = x * size - WEB_MERCATOR_HALF_WORLD
+    east = (x + 1) * size - WEB_MERCATOR_HALF_WORLD
+    north = WEB_MERCATOR_HALF_WORLD - y * size
+    south = WEB_MERCATOR_HALF_WORLD - (y + 1) * size
+    return west, south, east, north
+
+def _build_empty_tile_bytes():
+    """Encode an empty transparent tile as PNG."""
     from PIL import Image
     import io
     
@@ -42,3 +90,10 @@ def create_empty_tile():
     img.save(img_bytes, format="PNG")
     img_bytes.seek(0)
     return img_bytes.getvalue()
+
+# The empty tile never changes, so it is encoded only once
+_EMPTY_TILE_PNG = _build_empty_tile_bytes()
+
+def create_empty_tile():
+    """Return the bytes of an empty transparent tile."""
+    return _EMPTY_TILE_PNG